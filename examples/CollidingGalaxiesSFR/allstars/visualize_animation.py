@@ -5,253 +5,299 @@ Creates an animation showing newly formed stars over time
 """
 
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # headless rendering; skips GUI backend setup on cluster nodes
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from matplotlib.patches import Circle
-import h5py
 import glob
 import os
+import sys
 
-def load_snapshot(filename):
-    """Load particle data from HDF5 snapshot"""
-    with h5py.File(filename, 'r') as f:
-        # Get header info
-        time = f['Header'].attrs['Time']
-        
-        data = {}
-        
-        # Load newly formed stars (PartType4)
-        if 'PartType4' in f:
-            data['newstars_pos'] = f['PartType4/Coordinates'][:]
-            data['newstars_mass'] = f['PartType4/Masses'][:]
-            data['newstars_time'] = f['PartType4/StellarFormationTime'][:]
-        else:
-            data['newstars_pos'] = np.array([]).reshape(0, 3)
-            data['newstars_mass'] = np.array([])
-            data['newstars_time'] = np.array([])
-        
-        # Load pre-existing stellar disk (PartType2)
-        if 'PartType2' in f:
-            data['disk_pos'] = f['PartType2/Coordinates'][:]
-        else:
-            data['disk_pos'] = np.array([]).reshape(0, 3)
-        
-        # Load bulge stars (PartType3)
-        if 'PartType3' in f:
-            data['bulge_pos'] = f['PartType3/Coordinates'][:]
-        else:
-            data['bulge_pos'] = np.array([]).reshape(0, 3)
-        
-        data['time'] = time
-        
-    return data
-
-def create_animation(output_dir='output', save_file='galaxy_collision.mp4', fps=2):
-    """Create animation from all snapshots"""
-    
-    # Find all snapshot files
-    snapshot_files = sorted(glob.glob(os.path.join(output_dir, 'snapshot_*.hdf5')))
-    
-    if not snapshot_files:
-        print(f"No snapshots found in {output_dir}")
-        return
-    
-    print(f"Found {len(snapshot_files)} snapshots")
-    
-    # Load all snapshots
-    snapshots = []
-    for sfile in snapshot_files:
-        print(f"Loading {os.path.basename(sfile)}...")
-        snapshots.append(load_snapshot(sfile))
-    
-    # Determine coordinate limits from all snapshots
-    all_x = []
-    all_y = []
-    for snap in snapshots:
+# Shared loading/rendering helpers live one directory up, next to the
+# per-view subdirectories
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from viz_common import (percentile_1_99, load_snapshots, compute_density_vmax,
+                        save_limits_cache, load_limits_cache, save_animation)
+
+# Density-image resolution shared by both passes; matches the
+# 10 in x 100 dpi pixel grid of the static frames
+HIST_BINS = (1000, 1000)
+
+def compute_limits(snapshots, stride=4):
+    """Percentile-based axis limits.
+
+    Scans ~8 evenly spaced snapshots rather than all of them: 1st/99th
+    percentiles are stable to pixel precision unless the system drifts
+    between samples, and colliding galaxies can drift - so if the
+    sampled percentiles move by more than 10% between consecutive
+    samples, the full pass runs after all.
+    """
+    def snap_percentiles(snap):
+        parts = [snap['disk_pos'], snap['bulge_pos']]
         if len(snap['newstars_pos']) > 0:
-            all_x.extend(snap['newstars_pos'][:, 0])
-            all_y.extend(snap['newstars_pos'][:, 1])
-        all_x.extend(snap['disk_pos'][:, 0])
-        all_y.extend(snap['disk_pos'][:, 1])
-        all_x.extend(snap['bulge_pos'][:, 0])
-        all_y.extend(snap['bulge_pos'][:, 1])
-    
-    xlim = [np.percentile(all_x, 1), np.percentile(all_x, 99)]
-    ylim = [np.percentile(all_y, 1), np.percentile(all_y, 99)]
-    
+            parts.append(snap['newstars_pos'][:, :2])
+        xy = np.concatenate(parts)[::stride]
+        if len(xy) == 0:
+            return None
+        x_lo, x_hi = percentile_1_99(np.ascontiguousarray(xy[:, 0]))
+        y_lo, y_hi = percentile_1_99(np.ascontiguousarray(xy[:, 1]))
+        return x_lo, x_hi, y_lo, y_hi
+
+    def drifted(a, b):
+        span = max(a[1] - a[0], a[3] - a[2])
+        return any(abs(bv - av) > 0.1 * span for av, bv in zip(a, b))
+
+    step = max(1, len(snapshots) // 8)
+    sampled = [p for p in map(snap_percentiles, snapshots[::step])
+               if p is not None]
+    if step > 1 and any(drifted(a, b) for a, b in zip(sampled, sampled[1:])):
+        sampled = [p for p in map(snap_percentiles, snapshots)
+                   if p is not None]
+
+    x_lo = min(p[0] for p in sampled)
+    x_hi = max(p[1] for p in sampled)
+    y_lo = min(p[2] for p in sampled)
+    y_hi = max(p[3] for p in sampled)
+
     # Add some padding
-    x_range = xlim[1] - xlim[0]
-    y_range = ylim[1] - ylim[0]
-    xlim = [xlim[0] - 0.1*x_range, xlim[1] + 0.1*x_range]
-    ylim = [ylim[0] - 0.1*y_range, ylim[1] + 0.1*y_range]
-    
+    x_range = x_hi - x_lo
+    y_range = y_hi - y_lo
+    xlim = [x_lo - 0.1*x_range, x_hi + 0.1*x_range]
+    ylim = [y_lo - 0.1*y_range, y_hi + 0.1*y_range]
+    return xlim, ylim
+
+def create_animation(snapshots=None, output_dir='output',
+                     save_file='galaxy_collision.mp4', fps=2,
+                     frames_dir='frames'):
+    """Create animation from all snapshots.
+
+    Pass a preloaded snapshot list to share the load work with
+    create_static_frames; with snapshots=None the HDF5 files are
+    located and loaded here.
+    """
+    if snapshots is None:
+        snapshot_files = sorted(glob.glob(os.path.join(output_dir, 'snapshot_*.hdf5')))
+        if not snapshot_files:
+            print(f"No snapshots found in {output_dir}")
+            return
+        print(f"Loading {len(snapshot_files)} snapshots...")
+        snapshots = load_snapshots(snapshot_files, projection='xy')
+        if snapshots is None:
+            return  # non-root MPI rank; rank 0 renders
+
+    print(f"Found {len(snapshots)} snapshots")
+
+    # Determine coordinate limits, reusing the cache written by
+    # create_static_frames rather than re-scanning every snapshot
+    cached = load_limits_cache(frames_dir)
+    if cached is not None:
+        xlim, ylim, vmax = cached
+    else:
+        xlim, ylim = compute_limits(snapshots)
+        vmax = compute_density_vmax(snapshots, xlim, ylim, HIST_BINS)
+
     print(f"Coordinate range: X={xlim}, Y={ylim}")
-    
-    # Create figure
-    fig, ax = plt.subplots(figsize=(10, 10), facecolor='black')
+
+    # One buffer for the disk+bulge offsets, reused every frame -
+    # avoids a fresh np.vstack allocation per frame
+    n_old_max = max(len(s['disk_pos']) + len(s['bulge_pos']) for s in snapshots)
+    old_pos_buf = np.empty((n_old_max, 2), dtype=np.float32)
+
+    # Same treatment for the new-star offsets: refill one float32
+    # buffer per frame instead of handing set_offsets a fresh slice
+    n_new_max = max(len(s['newstars_pos']) for s in snapshots)
+    new_pos_buf = np.empty((max(n_new_max, 1), 2), dtype=np.float32)
+
+    # Create figure; the canvas is piped to ffmpeg at its native
+    # resolution, so set the movie dpi here
+    fig, ax = plt.subplots(figsize=(10, 10), dpi=150, facecolor='black')
     ax.set_facecolor('black')
     ax.set_xlim(xlim)
     ax.set_ylim(ylim)
     ax.set_aspect('equal')
     ax.axis('off')
-    
-    # Initialize empty scatter plots
-    old_stars = ax.scatter([], [], c='white', s=0.1, alpha=0.3, label='Pre-existing stars')
-    new_stars = ax.scatter([], [], c='cyan', s=1.0, alpha=0.8, label='Newly formed stars')
-    
+
+    # Pre-existing stars as a log-scaled density image, matching the
+    # static frames: the per-frame update is one histogram2d plus one
+    # contiguous set_data, instead of resizing a scatter PathCollection
+    # and invalidating its path cache. The color scale is fixed to the
+    # run-wide maximum so equal densities render equally in every frame
+    old_stars = ax.imshow(np.zeros((HIST_BINS[1], HIST_BINS[0])), cmap='gray',
+                          origin='lower', vmin=0.0, vmax=vmax,
+                          extent=(xlim[0], xlim[1], ylim[0], ylim[1]),
+                          interpolation='nearest', animated=True)
+    new_stars = ax.scatter([], [], c='cyan', s=1.0, alpha=0.8, rasterized=True,
+                           label='Newly formed stars')
+
     # Time text
-    time_text = ax.text(0.02, 0.98, '', transform=ax.transAxes, 
+    time_text = ax.text(0.02, 0.98, '', transform=ax.transAxes,
                        color='white', fontsize=14, verticalalignment='top',
                        bbox=dict(boxstyle='round', facecolor='black', alpha=0.5))
-    
+
     # Star count text
     count_text = ax.text(0.02, 0.92, '', transform=ax.transAxes,
                         color='cyan', fontsize=12, verticalalignment='top',
                         bbox=dict(boxstyle='round', facecolor='black', alpha=0.5))
-    
+
     def init():
-        old_stars.set_offsets(np.empty((0, 2)))
-        new_stars.set_offsets(np.empty((0, 2)))
+        old_stars.set_data(np.zeros((HIST_BINS[1], HIST_BINS[0])))
+        new_stars.set_offsets(new_pos_buf[:0])
         time_text.set_text('')
         count_text.set_text('')
         return old_stars, new_stars, time_text, count_text
-    
+
     def animate(frame):
         snap = snapshots[frame]
-        
-        # Plot pre-existing stars (disk + bulge)
-        old_pos = np.vstack([snap['disk_pos'][:, :2], snap['bulge_pos'][:, :2]])
-        old_stars.set_offsets(old_pos)
-        
-        # Plot newly formed stars
-        if len(snap['newstars_pos']) > 0:
-            new_stars.set_offsets(snap['newstars_pos'][:, :2])
-        else:
-            new_stars.set_offsets(np.empty((0, 2)))
-        
+
+        # Plot pre-existing stars (disk + bulge) as a density image,
+        # binned from the reused buffer
+        nd, nb = len(snap['disk_pos']), len(snap['bulge_pos'])
+        old_pos_buf[:nd] = snap['disk_pos']
+        old_pos_buf[nd:nd+nb] = snap['bulge_pos']
+        H, _, _ = np.histogram2d(old_pos_buf[:nd+nb, 0], old_pos_buf[:nd+nb, 1],
+                                 bins=HIST_BINS, range=[xlim, ylim])
+        old_stars.set_data(np.log1p(H.T))
+
+        # Plot newly formed stars; a zero-length buffer view also
+        # covers the frames before any stars have formed
+        nn = len(snap['newstars_pos'])
+        new_pos_buf[:nn] = snap['newstars_pos'][:, :2]
+        new_stars.set_offsets(new_pos_buf[:nn])
+
         # Update text
         time_text.set_text(f"Time: {snap['time']:.3f} Gyr")
-        count_text.set_text(f"New stars: {len(snap['newstars_pos']):,}")
-        
+        count_text.set_text(f"New stars: {nn:,}")
+
         return old_stars, new_stars, time_text, count_text
-    
-    # Create animation
-    print(f"\nCreating animation with {len(snapshots)} frames...")
-    anim = animation.FuncAnimation(fig, animate, init_func=init,
-                                 frames=len(snapshots), interval=1000/fps,
-                                 blit=True, repeat=True)
-    
+
     # Save animation
-    print(f"Saving animation to {save_file}...")
-    try:
-        anim.save(save_file, writer='ffmpeg', fps=fps, dpi=150,
-                 extra_args=['-vcodec', 'libx264'])
-        print(f"Animation saved successfully to {save_file}")
-    except Exception as e:
-        print(f"Could not save MP4 (ffmpeg might not be installed): {e}")
-        print("Trying GIF format instead...")
-        gif_file = save_file.replace('.mp4', '.gif')
-        anim.save(gif_file, writer='pillow', fps=fps)
-        print(f"Animation saved as GIF: {gif_file}")
-    
-    plt.close()
-    
+    print(f"\nCreating animation with {len(snapshots)} frames...")
+    save_animation(fig, animate, len(snapshots), save_file, fps, init_func=init)
+
+    plt.close(fig)
+
     print("\nDone!")
 
-def create_static_frames(output_dir='output', frames_dir='frames'):
-    """Create static PNG images for each snapshot"""
-    
+def create_static_frames(snapshots=None, output_dir='output', frames_dir='frames'):
+    """Create static PNG images for each snapshot.
+
+    Pass a preloaded snapshot list to share the load work with
+    create_animation; with snapshots=None the HDF5 files are located
+    and loaded here.
+    """
     # Create frames directory
     os.makedirs(frames_dir, exist_ok=True)
-    
-    # Find all snapshot files
-    snapshot_files = sorted(glob.glob(os.path.join(output_dir, 'snapshot_*.hdf5')))
-    
-    print(f"Creating {len(snapshot_files)} static frames...")
-    
-    # Load first and last to determine limits
-    snapshots = [load_snapshot(f) for f in snapshot_files]
-    
-    all_x = []
-    all_y = []
-    for snap in snapshots:
-        if len(snap['newstars_pos']) > 0:
-            all_x.extend(snap['newstars_pos'][:, 0])
-            all_y.extend(snap['newstars_pos'][:, 1])
-        all_x.extend(snap['disk_pos'][:, 0])
-        all_y.extend(snap['disk_pos'][:, 1])
-        all_x.extend(snap['bulge_pos'][:, 0])
-        all_y.extend(snap['bulge_pos'][:, 1])
-    
-    xlim = [np.percentile(all_x, 1), np.percentile(all_x, 99)]
-    ylim = [np.percentile(all_y, 1), np.percentile(all_y, 99)]
-    x_range = xlim[1] - xlim[0]
-    y_range = ylim[1] - ylim[0]
-    xlim = [xlim[0] - 0.1*x_range, xlim[1] + 0.1*x_range]
-    ylim = [ylim[0] - 0.1*y_range, ylim[1] + 0.1*y_range]
-    
-    for i, (sfile, snap) in enumerate(zip(snapshot_files, snapshots)):
-        fig, ax = plt.subplots(figsize=(10, 10), facecolor='black')
-        ax.set_facecolor('black')
-        ax.set_xlim(xlim)
-        ax.set_ylim(ylim)
-        ax.set_aspect('equal')
-        ax.axis('off')
-        
-        # Plot pre-existing stars
-        old_pos = np.vstack([snap['disk_pos'][:, :2], snap['bulge_pos'][:, :2]])
-        ax.scatter(old_pos[:, 0], old_pos[:, 1], c='white', s=0.1, alpha=0.3)
-        
-        # Plot newly formed stars
-        if len(snap['newstars_pos']) > 0:
-            ax.scatter(snap['newstars_pos'][:, 0], snap['newstars_pos'][:, 1],
-                      c='cyan', s=1.0, alpha=0.8)
-        
-        # Add text
-        ax.text(0.02, 0.98, f"Time: {snap['time']:.3f} Gyr",
-               transform=ax.transAxes, color='white', fontsize=14,
-               verticalalignment='top',
-               bbox=dict(boxstyle='round', facecolor='black', alpha=0.5))
-        
-        ax.text(0.02, 0.92, f"New stars: {len(snap['newstars_pos']):,}",
-               transform=ax.transAxes, color='cyan', fontsize=12,
-               verticalalignment='top',
-               bbox=dict(boxstyle='round', facecolor='black', alpha=0.5))
-        
+
+    if snapshots is None:
+        snapshot_files = sorted(glob.glob(os.path.join(output_dir, 'snapshot_*.hdf5')))
+        if not snapshot_files:
+            print(f"No snapshots found in {output_dir}")
+            return
+        snapshots = load_snapshots(snapshot_files, projection='xy')
+        if snapshots is None:
+            return  # non-root MPI rank; rank 0 renders
+
+    print(f"Creating {len(snapshots)} static frames...")
+
+    xlim, ylim = compute_limits(snapshots)
+    # One run-wide color scale for the density images, cached with the
+    # limits so create_animation renders identically
+    vmax = compute_density_vmax(snapshots, xlim, ylim, HIST_BINS)
+    save_limits_cache(frames_dir, xlim, ylim, vmax)
+
+    # Reused disk+bulge and new-star buffers, as in create_animation
+    n_old_max = max(len(s['disk_pos']) + len(s['bulge_pos']) for s in snapshots)
+    old_pos_buf = np.empty((n_old_max, 2), dtype=np.float32)
+    n_new_max = max(len(s['newstars_pos']) for s in snapshots)
+    new_pos_buf = np.empty((max(n_new_max, 1), 2), dtype=np.float32)
+
+    # Build the figure and artists once; per frame only the offsets and
+    # text change before fig.savefig - full Axes construction per frame
+    # is far more expensive than the scatter updates themselves
+    fig, ax = plt.subplots(figsize=(10, 10), facecolor='black')
+    ax.set_facecolor('black')
+    ax.set_xlim(xlim)
+    ax.set_ylim(ylim)
+    ax.set_aspect('equal')
+    ax.axis('off')
+
+    # Pre-existing stars render as a log-scaled density image: one
+    # np.histogram2d per frame runs in C and stays O(N), where scatter
+    # pushes every star through its own Path object
+    old_stars = ax.imshow(np.zeros((HIST_BINS[1], HIST_BINS[0])), cmap='gray',
+                          origin='lower', vmin=0.0, vmax=vmax,
+                          extent=(xlim[0], xlim[1], ylim[0], ylim[1]),
+                          interpolation='nearest')
+    new_stars = ax.scatter([], [], c='cyan', s=1.0, alpha=0.8, rasterized=True)
+
+    time_text = ax.text(0.02, 0.98, '', transform=ax.transAxes,
+                       color='white', fontsize=14, verticalalignment='top',
+                       bbox=dict(boxstyle='round', facecolor='black', alpha=0.5))
+    count_text = ax.text(0.02, 0.92, '', transform=ax.transAxes,
+                        color='cyan', fontsize=12, verticalalignment='top',
+                        bbox=dict(boxstyle='round', facecolor='black', alpha=0.5))
+
+    for i, snap in enumerate(snapshots):
+        # Plot pre-existing stars as a density image
+        nd, nb = len(snap['disk_pos']), len(snap['bulge_pos'])
+        old_pos_buf[:nd] = snap['disk_pos']
+        old_pos_buf[nd:nd+nb] = snap['bulge_pos']
+        H, _, _ = np.histogram2d(old_pos_buf[:nd+nb, 0], old_pos_buf[:nd+nb, 1],
+                                 bins=HIST_BINS, range=[xlim, ylim])
+        old_stars.set_data(np.log1p(H.T))
+
+        # Plot newly formed stars; a zero-length buffer view also
+        # covers the frames before any stars have formed
+        nn = len(snap['newstars_pos'])
+        new_pos_buf[:nn] = snap['newstars_pos'][:, :2]
+        new_stars.set_offsets(new_pos_buf[:nn])
+
+        # Update text
+        time_text.set_text(f"Time: {snap['time']:.3f} Gyr")
+        count_text.set_text(f"New stars: {nn:,}")
+
         # Save frame
         frame_file = os.path.join(frames_dir, f'frame_{i:03d}.png')
-        plt.savefig(frame_file, dpi=150, facecolor='black')
-        plt.close()
-        
+        # 100 dpi is plenty for sub-point markers and encodes much faster
+        fig.savefig(frame_file, dpi=100, facecolor='black')
+
         print(f"  Saved {frame_file}")
-    
+
+    plt.close(fig)
+
     print(f"\nAll frames saved to {frames_dir}/")
     print(f"You can create a video with: ffmpeg -framerate 2 -i {frames_dir}/frame_%03d.png -c:v libx264 -pix_fmt yuv420p galaxy_collision.mp4")
 
 if __name__ == '__main__':
-    import sys
-    
     # Change to script directory
     script_dir = os.path.dirname(os.path.abspath(__file__))
     os.chdir(script_dir)
-    
+
     print("=" * 60)
     print("Galaxy Collision Visualization")
     print("=" * 60)
-    
+
     # Check if output directory exists
     if not os.path.exists('output'):
         print("Error: output/ directory not found")
         sys.exit(1)
-    
-    # Create static frames (always works)
-    create_static_frames()
-    
-    print("\n" + "=" * 60)
-    
-    # Try to create animation
-    try:
-        create_animation()
-    except Exception as e:
-        print(f"Animation creation failed: {e}")
-        print("Static frames were created successfully in frames/ directory")
+
+    # Load the snapshots once and share them between both passes
+    snapshot_files = sorted(glob.glob(os.path.join('output', 'snapshot_*.hdf5')))
+    if not snapshot_files:
+        print("Error: no snapshots found in output/")
+        sys.exit(1)
+    print(f"Loading {len(snapshot_files)} snapshots...")
+    snapshots = load_snapshots(snapshot_files, projection='xy')
+
+    if snapshots is not None:  # None on non-root MPI ranks
+        # Create static frames (always works)
+        create_static_frames(snapshots)
+
+        print("\n" + "=" * 60)
+
+        # Try to create animation
+        try:
+            create_animation(snapshots)
+        except Exception as e:
+            print(f"Animation creation failed: {e}")
+            print("Static frames were created successfully in frames/ directory")
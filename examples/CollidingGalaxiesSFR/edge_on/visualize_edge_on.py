@@ -5,290 +5,337 @@ Shows thin stellar disks colliding horizontally
 """
 
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # headless rendering; skips GUI backend setup on cluster nodes
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-import h5py
 import glob
 import os
+import sys
 
-def load_snapshot(filename):
-    """Load particle data from HDF5 snapshot"""
-    with h5py.File(filename, 'r') as f:
-        # Get header info
-        time = f['Header'].attrs['Time']
-        
-        data = {}
-        
-        # Load newly formed stars (PartType4)
-        if 'PartType4' in f:
-            data['newstars_pos'] = f['PartType4/Coordinates'][:]
-            data['newstars_mass'] = f['PartType4/Masses'][:]
-            data['newstars_time'] = f['PartType4/StellarFormationTime'][:]
-        else:
-            data['newstars_pos'] = np.array([]).reshape(0, 3)
-            data['newstars_mass'] = np.array([])
-            data['newstars_time'] = np.array([])
-        
-        # Load pre-existing stellar disk (PartType2)
-        if 'PartType2' in f:
-            data['disk_pos'] = f['PartType2/Coordinates'][:]
-        else:
-            data['disk_pos'] = np.array([]).reshape(0, 3)
-        
-        # Load bulge stars (PartType3)
-        if 'PartType3' in f:
-            data['bulge_pos'] = f['PartType3/Coordinates'][:]
-        else:
-            data['bulge_pos'] = np.array([]).reshape(0, 3)
-        
-        data['time'] = time
-        
-    return data
-
-def create_animation(output_dir='../output', save_file='edge_on.mp4', fps=2):
-    """Create edge-on animation (X-Z view)"""
-    
-    # Find all snapshot files
-    snapshot_files = sorted(glob.glob(os.path.join(output_dir, 'snapshot_*.hdf5')))
-    
-    if not snapshot_files:
-        print(f"No snapshots found in {output_dir}")
-        return
-    
-    print(f"Found {len(snapshot_files)} snapshots")
-    print("View: Edge-on (X-Z plane)")
-    
-    # Load all snapshots
-    snapshots = []
-    for sfile in snapshot_files:
-        print(f"Loading {os.path.basename(sfile)}...")
-        snapshots.append(load_snapshot(sfile))
-    
-    # Determine coordinate limits - using X and Z
-    all_x = []
-    all_z = []
-    for snap in snapshots:
+# Shared loading/rendering helpers live one directory up, next to the
+# per-view subdirectories
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from viz_common import (percentile_1_99, load_snapshots, compute_density_vmax,
+                        save_limits_cache, load_limits_cache, save_animation)
+
+# Density-image resolution shared by both passes; 3:1, matching the
+# fixed X:Z frame ratio
+HIST_BINS = (1200, 400)
+
+def compute_limits(snapshots, stride=4):
+    """Percentile-based axis limits for the edge-on view.
+
+    Only X needs percentiles - the Z extent is pinned to a third of
+    the X range below so the thin disks fill the frame. Scans ~8
+    evenly spaced snapshots rather than all of them; if the sampled
+    percentiles move by more than 10% between consecutive samples the
+    box is drifting, and the full pass runs after all.
+    """
+    def snap_percentiles(snap):
+        parts = [snap['disk_pos'][:, 0], snap['bulge_pos'][:, 0]]
         if len(snap['newstars_pos']) > 0:
-            all_x.extend(snap['newstars_pos'][:, 0])
-            all_z.extend(snap['newstars_pos'][:, 2])
-        all_x.extend(snap['disk_pos'][:, 0])
-        all_z.extend(snap['disk_pos'][:, 2])
-        all_x.extend(snap['bulge_pos'][:, 0])
-        all_z.extend(snap['bulge_pos'][:, 2])
-    
-    xlim = [np.percentile(all_x, 1), np.percentile(all_x, 99)]
-    zlim = [np.percentile(all_z, 1), np.percentile(all_z, 99)]
-    
+            parts.append(snap['newstars_pos'][:, 0])
+        x = np.concatenate(parts)[::stride]
+        if len(x) == 0:
+            return None
+        return percentile_1_99(x)
+
+    def drifted(a, b):
+        span = a[1] - a[0]
+        return any(abs(bv - av) > 0.1 * span for av, bv in zip(a, b))
+
+    step = max(1, len(snapshots) // 8)
+    sampled = [p for p in map(snap_percentiles, snapshots[::step])
+               if p is not None]
+    if step > 1 and any(drifted(a, b) for a, b in zip(sampled, sampled[1:])):
+        sampled = [p for p in map(snap_percentiles, snapshots)
+                   if p is not None]
+
+    x_lo = min(p[0] for p in sampled)
+    x_hi = max(p[1] for p in sampled)
+
     # Add some padding
-    x_range = xlim[1] - xlim[0]
-    z_range = zlim[1] - zlim[0]
-    xlim = [xlim[0] - 0.1*x_range, xlim[1] + 0.1*x_range]
-    
+    x_range = x_hi - x_lo
+    xlim = [x_lo - 0.1*x_range, x_hi + 0.1*x_range]
+
     # Make Z range much larger to fill the frame better
     # Expand Z to about 1/3 of X range for better visibility
     z_max = (xlim[1] - xlim[0]) / 3.0
     zlim = [-z_max, z_max]
-    
+    return xlim, zlim
+
+def create_animation(snapshots=None, output_dir='../output',
+                     save_file='edge_on.mp4', fps=2, frames_dir='frames'):
+    """Create edge-on animation (X-Z view).
+
+    Pass a preloaded snapshot list to share the load work with
+    create_static_frames; with snapshots=None the HDF5 files are
+    located and loaded here.
+    """
+    if snapshots is None:
+        snapshot_files = sorted(glob.glob(os.path.join(output_dir, 'snapshot_*.hdf5')))
+        if not snapshot_files:
+            print(f"No snapshots found in {output_dir}")
+            return
+        print(f"Loading {len(snapshot_files)} snapshots...")
+        snapshots = load_snapshots(snapshot_files, projection='xz')
+        if snapshots is None:
+            return  # non-root MPI rank; rank 0 renders
+
+    print(f"Found {len(snapshots)} snapshots")
+    print("View: Edge-on (X-Z plane)")
+
+    # Determine coordinate limits - using X and Z - reusing the cache
+    # written by create_static_frames rather than re-scanning snapshots
+    cached = load_limits_cache(frames_dir)
+    if cached is not None:
+        xlim, zlim, vmax = cached
+    else:
+        xlim, zlim = compute_limits(snapshots)
+        vmax = compute_density_vmax(snapshots, xlim, zlim, HIST_BINS)
+
     print(f"Coordinate range: X={xlim}, Z={zlim}")
-    
+
+    # One buffer for the disk+bulge offsets, reused every frame -
+    # avoids a fresh np.vstack allocation per frame
+    n_old_max = max(len(s['disk_pos']) + len(s['bulge_pos']) for s in snapshots)
+    old_pos_buf = np.empty((n_old_max, 2), dtype=np.float32)
+
+    # Newly formed stars keep all three axes, so X and Z have to be
+    # gathered out of the (N, 3) array; two contiguous column copies
+    # into a reused buffer beat the fancy [:, [0, 2]] gather, which
+    # allocates a fresh array and walks the columns element-wise
+    n_new_max = max(len(s['newstars_pos']) for s in snapshots)
+    new_pos_buf = np.empty((max(n_new_max, 1), 2), dtype=np.float32)
+
     # Calculate figure size to match data aspect ratio (equal scaling)
     x_range = xlim[1] - xlim[0]
     z_range = zlim[1] - zlim[0]
     aspect_ratio = x_range / z_range
     fig_height = 8
     fig_width = fig_height * aspect_ratio
-    
-    # Create figure with aspect ratio matching the data
-    fig, ax = plt.subplots(figsize=(fig_width, fig_height), facecolor='black')
+
+    # Create figure with aspect ratio matching the data; the canvas is
+    # piped to ffmpeg at its native resolution, so set the movie dpi here
+    fig, ax = plt.subplots(figsize=(fig_width, fig_height), dpi=150,
+                           facecolor='black')
     ax.set_facecolor('black')
     ax.set_xlim(xlim)
     ax.set_ylim(zlim)
     ax.set_aspect('equal')  # Keep equal scaling
     ax.axis('off')
-    
+
     # Remove margins to eliminate black borders
     plt.subplots_adjust(left=0, right=1, top=1, bottom=0)
-    
-    # Initialize empty scatter plots - X-Z plane
-    old_stars = ax.scatter([], [], c='white', s=0.2, alpha=0.4, label='Pre-existing stars')
-    new_stars = ax.scatter([], [], c='cyan', s=1.5, alpha=0.9, edgecolors='white', linewidths=0.1)
-    
+
+    # Pre-existing stars as a log-scaled density image, as in the static
+    # frames: the per-frame update is one histogram2d plus a set_data,
+    # instead of resizing a scatter PathCollection. The color scale is
+    # fixed to the run-wide maximum so equal densities render equally
+    # in every frame
+    old_stars = ax.imshow(np.zeros((HIST_BINS[1], HIST_BINS[0])), cmap='gray',
+                          origin='lower', vmin=0.0, vmax=vmax,
+                          extent=(xlim[0], xlim[1], zlim[0], zlim[1]),
+                          interpolation='nearest', animated=True)
+    new_stars = ax.scatter([], [], c='cyan', s=1.5, alpha=0.9, rasterized=True,
+                           edgecolors='white', linewidths=0.1)
+
     # Time text
-    time_text = ax.text(0.02, 0.98, '', transform=ax.transAxes, 
+    time_text = ax.text(0.02, 0.98, '', transform=ax.transAxes,
                        color='white', fontsize=14, verticalalignment='top',
                        bbox=dict(boxstyle='round', facecolor='black', alpha=0.5))
-    
+
     # Star count text
     count_text = ax.text(0.02, 0.92, '', transform=ax.transAxes,
                         color='cyan', fontsize=12, verticalalignment='top',
                         bbox=dict(boxstyle='round', facecolor='black', alpha=0.5))
-    
+
     # View label
-    view_text = ax.text(0.98, 0.98, 'Edge-on view (X-Z plane)', 
+    view_text = ax.text(0.98, 0.98, 'Edge-on view (X-Z plane)',
                        transform=ax.transAxes, color='yellow', fontsize=12,
                        verticalalignment='top', horizontalalignment='right',
                        bbox=dict(boxstyle='round', facecolor='black', alpha=0.5))
-    
+
     def init():
-        old_stars.set_offsets(np.empty((0, 2)))
-        new_stars.set_offsets(np.empty((0, 2)))
+        old_stars.set_data(np.zeros((HIST_BINS[1], HIST_BINS[0])))
+        new_stars.set_offsets(new_pos_buf[:0])
         time_text.set_text('')
         count_text.set_text('')
         return old_stars, new_stars, time_text, count_text, view_text
-    
+
     def animate(frame):
         snap = snapshots[frame]
-        
-        # Plot pre-existing stars (disk + bulge) in X-Z plane
-        old_pos = np.vstack([snap['disk_pos'], snap['bulge_pos']])
-        old_stars.set_offsets(old_pos[:, [0, 2]])  # X and Z coordinates
-        
-        # Plot newly formed stars in X-Z plane
-        if len(snap['newstars_pos']) > 0:
-            new_stars.set_offsets(snap['newstars_pos'][:, [0, 2]])
-        else:
-            new_stars.set_offsets(np.empty((0, 2)))
-        
+
+        # Plot pre-existing stars (disk + bulge) as a density image,
+        # binned from the reused buffer; positions are already projected
+        # to X-Z on load
+        nd, nb = len(snap['disk_pos']), len(snap['bulge_pos'])
+        old_pos_buf[:nd] = snap['disk_pos']
+        old_pos_buf[nd:nd+nb] = snap['bulge_pos']
+        H, _, _ = np.histogram2d(old_pos_buf[:nd+nb, 0], old_pos_buf[:nd+nb, 1],
+                                 bins=HIST_BINS, range=[xlim, zlim])
+        old_stars.set_data(np.log1p(H.T))
+
+        # Plot newly formed stars in X-Z plane; a zero-length buffer
+        # view also covers the frames before any stars have formed
+        nn = len(snap['newstars_pos'])
+        new_pos_buf[:nn, 0] = snap['newstars_pos'][:, 0]
+        new_pos_buf[:nn, 1] = snap['newstars_pos'][:, 2]
+        new_stars.set_offsets(new_pos_buf[:nn])
+
         # Update text
         time_text.set_text(f"Time: {snap['time']:.3f} Gyr")
-        count_text.set_text(f"New stars: {len(snap['newstars_pos']):,}")
-        
+        count_text.set_text(f"New stars: {nn:,}")
+
         return old_stars, new_stars, time_text, count_text, view_text
-    
-    # Create animation
-    print(f"\nCreating animation with {len(snapshots)} frames...")
-    anim = animation.FuncAnimation(fig, animate, init_func=init,
-                                 frames=len(snapshots), interval=1000/fps,
-                                 blit=True, repeat=True)
-    
+
     # Save animation
-    print(f"Saving animation to {save_file}...")
-    try:
-        anim.save(save_file, writer='ffmpeg', fps=fps, dpi=150,
-                 extra_args=['-vcodec', 'libx264'])
-        print(f"Animation saved successfully to {save_file}")
-    except Exception as e:
-        print(f"Could not save MP4 (ffmpeg might not be installed): {e}")
-        print("Trying GIF format instead...")
-        gif_file = save_file.replace('.mp4', '.gif')
-        anim.save(gif_file, writer='pillow', fps=fps)
-        print(f"Animation saved as GIF: {gif_file}")
-    
-    plt.close()
-    
+    print(f"\nCreating animation with {len(snapshots)} frames...")
+    save_animation(fig, animate, len(snapshots), save_file, fps, init_func=init)
+
+    plt.close(fig)
+
     print("\nDone!")
 
-def create_static_frames(output_dir='../output', frames_dir='frames'):
-    """Create static PNG images for each snapshot - edge-on view"""
-    
+def create_static_frames(snapshots=None, output_dir='../output', frames_dir='frames'):
+    """Create static PNG images for each snapshot - edge-on view.
+
+    Pass a preloaded snapshot list to share the load work with
+    create_animation; with snapshots=None the HDF5 files are located
+    and loaded here.
+    """
     # Create frames directory
     os.makedirs(frames_dir, exist_ok=True)
-    
-    # Find all snapshot files
-    snapshot_files = sorted(glob.glob(os.path.join(output_dir, 'snapshot_*.hdf5')))
-    
-    print(f"Creating {len(snapshot_files)} static frames (edge-on view)...")
-    
-    # Load all snapshots
-    snapshots = [load_snapshot(f) for f in snapshot_files]
-    
+
+    if snapshots is None:
+        snapshot_files = sorted(glob.glob(os.path.join(output_dir, 'snapshot_*.hdf5')))
+        if not snapshot_files:
+            print(f"No snapshots found in {output_dir}")
+            return
+        snapshots = load_snapshots(snapshot_files, projection='xz')
+        if snapshots is None:
+            return  # non-root MPI rank; rank 0 renders
+
+    print(f"Creating {len(snapshots)} static frames (edge-on view)...")
+
     # Determine limits
-    all_x = []
-    all_z = []
-    for snap in snapshots:
-        if len(snap['newstars_pos']) > 0:
-            all_x.extend(snap['newstars_pos'][:, 0])
-            all_z.extend(snap['newstars_pos'][:, 2])
-        all_x.extend(snap['disk_pos'][:, 0])
-        all_z.extend(snap['disk_pos'][:, 2])
-        all_x.extend(snap['bulge_pos'][:, 0])
-        all_z.extend(snap['bulge_pos'][:, 2])
-    
-    xlim = [np.percentile(all_x, 1), np.percentile(all_x, 99)]
-    zlim = [np.percentile(all_z, 1), np.percentile(all_z, 99)]
-    x_range = xlim[1] - xlim[0]
-    xlim = [xlim[0] - 0.1*x_range, xlim[1] + 0.1*x_range]
-    
-    # Make Z range much larger to fill the frame better
-    z_max = (xlim[1] - xlim[0]) / 3.0
-    zlim = [-z_max, z_max]
-    
+    xlim, zlim = compute_limits(snapshots)
+    # One run-wide color scale for the density images, cached with the
+    # limits so create_animation renders identically
+    vmax = compute_density_vmax(snapshots, xlim, zlim, HIST_BINS)
+    save_limits_cache(frames_dir, xlim, zlim, vmax)
+
+    # Reused disk+bulge buffer, as in create_animation
+    n_old_max = max(len(s['disk_pos']) + len(s['bulge_pos']) for s in snapshots)
+    old_pos_buf = np.empty((n_old_max, 2), dtype=np.float32)
+
     # Calculate figure size to match data aspect ratio
     x_range = xlim[1] - xlim[0]
     z_range = zlim[1] - zlim[0]
     aspect_ratio = x_range / z_range
     fig_height = 8
     fig_width = fig_height * aspect_ratio
-    
-    for i, (sfile, snap) in enumerate(zip(snapshot_files, snapshots)):
-        fig, ax = plt.subplots(figsize=(fig_width, fig_height), facecolor='black')
-        ax.set_facecolor('black')
-        ax.set_xlim(xlim)
-        ax.set_ylim(zlim)
-        ax.set_aspect('equal')  # Keep equal scaling
-        ax.axis('off')
-        
-        # Remove margins to eliminate black borders
-        plt.subplots_adjust(left=0, right=1, top=1, bottom=0)
-        
-        # Plot pre-existing stars - X-Z plane
-        old_pos = np.vstack([snap['disk_pos'], snap['bulge_pos']])
-        ax.scatter(old_pos[:, 0], old_pos[:, 2], c='white', s=0.2, alpha=0.4)
-        
-        # Plot newly formed stars - X-Z plane
-        if len(snap['newstars_pos']) > 0:
-            ax.scatter(snap['newstars_pos'][:, 0], snap['newstars_pos'][:, 2],
-                      c='cyan', s=1.5, alpha=0.9, edgecolors='white', linewidths=0.1)
-        
-        # Add text
-        ax.text(0.02, 0.98, f"Time: {snap['time']:.3f} Gyr",
-               transform=ax.transAxes, color='white', fontsize=14,
-               verticalalignment='top',
-               bbox=dict(boxstyle='round', facecolor='black', alpha=0.5))
-        
-        ax.text(0.02, 0.92, f"New stars: {len(snap['newstars_pos']):,}",
-               transform=ax.transAxes, color='cyan', fontsize=12,
-               verticalalignment='top',
-               bbox=dict(boxstyle='round', facecolor='black', alpha=0.5))
-        
-        ax.text(0.98, 0.98, 'Edge-on view (X-Z plane)',
-               transform=ax.transAxes, color='yellow', fontsize=12,
-               verticalalignment='top', horizontalalignment='right',
-               bbox=dict(boxstyle='round', facecolor='black', alpha=0.5))
-        
+
+    # Reused buffer for the new-star X-Z offsets, as in create_animation
+    n_new_max = max(len(s['newstars_pos']) for s in snapshots)
+    new_pos_buf = np.empty((max(n_new_max, 1), 2), dtype=np.float32)
+
+    # Build the figure and artists once; per frame only the offsets and
+    # text change before fig.savefig - full Axes construction per frame
+    # is far more expensive than the scatter updates themselves
+    fig, ax = plt.subplots(figsize=(fig_width, fig_height), facecolor='black')
+    ax.set_facecolor('black')
+    ax.set_xlim(xlim)
+    ax.set_ylim(zlim)
+    ax.set_aspect('equal')  # Keep equal scaling
+    ax.axis('off')
+
+    # Remove margins to eliminate black borders
+    plt.subplots_adjust(left=0, right=1, top=1, bottom=0)
+
+    # Pre-existing stars render as a log-scaled density image: one
+    # np.histogram2d per frame runs in C and stays O(N), where scatter
+    # pushes every star through its own Path object
+    old_stars = ax.imshow(np.zeros((HIST_BINS[1], HIST_BINS[0])), cmap='gray',
+                          origin='lower', vmin=0.0, vmax=vmax,
+                          extent=(xlim[0], xlim[1], zlim[0], zlim[1]),
+                          interpolation='nearest')
+    new_stars = ax.scatter([], [], c='cyan', s=1.5, alpha=0.9, rasterized=True,
+                           edgecolors='white', linewidths=0.1)
+
+    time_text = ax.text(0.02, 0.98, '', transform=ax.transAxes,
+                       color='white', fontsize=14, verticalalignment='top',
+                       bbox=dict(boxstyle='round', facecolor='black', alpha=0.5))
+    count_text = ax.text(0.02, 0.92, '', transform=ax.transAxes,
+                        color='cyan', fontsize=12, verticalalignment='top',
+                        bbox=dict(boxstyle='round', facecolor='black', alpha=0.5))
+    ax.text(0.98, 0.98, 'Edge-on view (X-Z plane)',
+           transform=ax.transAxes, color='yellow', fontsize=12,
+           verticalalignment='top', horizontalalignment='right',
+           bbox=dict(boxstyle='round', facecolor='black', alpha=0.5))
+
+    for i, snap in enumerate(snapshots):
+        # Plot pre-existing stars as a density image - X-Z plane
+        nd, nb = len(snap['disk_pos']), len(snap['bulge_pos'])
+        old_pos_buf[:nd] = snap['disk_pos']
+        old_pos_buf[nd:nd+nb] = snap['bulge_pos']
+        H, _, _ = np.histogram2d(old_pos_buf[:nd+nb, 0], old_pos_buf[:nd+nb, 1],
+                                 bins=HIST_BINS, range=[xlim, zlim])
+        old_stars.set_data(np.log1p(H.T))
+
+        # Plot newly formed stars - X-Z plane; a zero-length buffer
+        # view also covers the frames before any stars have formed
+        nn = len(snap['newstars_pos'])
+        new_pos_buf[:nn, 0] = snap['newstars_pos'][:, 0]
+        new_pos_buf[:nn, 1] = snap['newstars_pos'][:, 2]
+        new_stars.set_offsets(new_pos_buf[:nn])
+
+        # Update text
+        time_text.set_text(f"Time: {snap['time']:.3f} Gyr")
+        count_text.set_text(f"New stars: {nn:,}")
+
         # Save frame
         frame_file = os.path.join(frames_dir, f'frame_{i:03d}.png')
-        plt.savefig(frame_file, dpi=150, facecolor='black')
-        plt.close()
-        
+        # 100 dpi is plenty for sub-point markers and encodes much faster
+        fig.savefig(frame_file, dpi=100, facecolor='black')
+
         print(f"  Saved {frame_file}")
-    
+
+    plt.close(fig)
+
     print(f"\nAll frames saved to {frames_dir}/")
 
 if __name__ == '__main__':
-    import sys
-    
     # Change to script directory
     script_dir = os.path.dirname(os.path.abspath(__file__))
     os.chdir(script_dir)
-    
+
     print("=" * 60)
     print("Galaxy Collision - Edge-On View (Stars Only)")
     print("=" * 60)
-    
+
     # Check if output directory exists
     if not os.path.exists('../output'):
         print("Error: ../output/ directory not found")
         sys.exit(1)
-    
-    # Create static frames
-    create_static_frames()
-    
-    print("\n" + "=" * 60)
-    
-    # Try to create animation
-    try:
-        create_animation()
-    except Exception as e:
-        print(f"Animation creation failed: {e}")
-        print("Static frames were created successfully in frames/ directory")
+
+    # Load the snapshots once and share them between both passes
+    snapshot_files = sorted(glob.glob(os.path.join('../output', 'snapshot_*.hdf5')))
+    if not snapshot_files:
+        print("Error: no snapshots found in ../output/")
+        sys.exit(1)
+    print(f"Loading {len(snapshot_files)} snapshots...")
+    snapshots = load_snapshots(snapshot_files, projection='xz')
+
+    if snapshots is not None:  # None on non-root MPI ranks
+        # Create static frames
+        create_static_frames(snapshots)
+
+        print("\n" + "=" * 60)
+
+        # Try to create animation
+        try:
+            create_animation(snapshots)
+        except Exception as e:
+            print(f"Animation creation failed: {e}")
+            print("Static frames were created successfully in frames/ directory")
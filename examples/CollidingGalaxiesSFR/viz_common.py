@@ -0,0 +1,255 @@
+"""
+Shared snapshot-loading and rendering helpers for the visualization
+scripts in the per-view subdirectories (allstars/, edge_on/, ...).
+
+Each view script keeps its own limits logic and figure layout; what
+lives here is everything that is identical between them: the parallel
+HDF5/.npy snapshot loading, the percentile kernel, the limits cache,
+and the ffmpeg/GIF animation writer.
+"""
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # headless rendering; skips GUI backend setup on cluster nodes
+import matplotlib.animation as animation
+import h5py
+import os
+import subprocess
+from functools import partial
+from multiprocessing import Pool
+from shutil import which
+
+# mpi4py is optional: when a script is launched under mpiexec the
+# snapshot reads are distributed across ranks, otherwise we fall back
+# to a local process pool
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+# numba is also optional: with it the percentile kernel below compiles
+# to native code, without it np.partition does the selection in C
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+def percentile_1_99(x):
+    """1st/99th percentiles of a 1D array via two O(N) partition selections.
+
+    Nearest-rank rather than interpolated, which is more than enough
+    for axis limits and avoids the full sort inside np.percentile.
+    """
+    k_lo = int(0.01 * (len(x) - 1))
+    k_hi = int(0.99 * (len(x) - 1))
+    return np.partition(x, k_lo)[k_lo], np.partition(x, k_hi)[k_hi]
+
+if njit is not None:
+    percentile_1_99 = njit(cache=True)(percentile_1_99)
+
+def read_dataset(f, name):
+    """Read a full dataset into a preallocated buffer.
+
+    read_direct streams the data straight into caller-owned memory,
+    avoiding the extra allocate-and-copy of the plain [:] read.
+    """
+    ds = f[name]
+    # float32 target: h5py converts on read, and pixel-level plotting
+    # has no use for the snapshot's float64 precision
+    arr = np.empty(ds.shape, dtype=np.float32)
+    ds.read_direct(arr)
+    return arr
+
+def read_columns(f, name, cols):
+    """Read only the given coordinate columns of a (N, 3) dataset.
+
+    Adjacent columns come in as a single hyperslab; non-adjacent ones
+    (x/z) as two contiguous column reads. Either way only the rendered
+    columns cross the disk, cutting the bytes moved by a third.
+    """
+    ds = f[name]
+    n = ds.shape[0]
+    arr = np.empty((n, len(cols)), dtype=np.float32)  # converted on read
+    if cols[-1] - cols[0] + 1 == len(cols):
+        ds.read_direct(arr, source_sel=np.s_[:, cols[0]:cols[-1] + 1])
+    else:
+        for j, c in enumerate(cols):
+            ds.read_direct(arr, source_sel=np.s_[:, c], dest_sel=np.s_[:, j])
+    return arr
+
+def load_snapshot_hdf5(filename, projection='xy'):
+    """Load particle data from HDF5 snapshot.
+
+    Only the two coordinate columns that end up on screen ('xy' or
+    'xz') are read for the big disk/bulge arrays; the unused axis
+    never leaves the disk. Masses and formation times are not read -
+    nothing downstream uses them.
+    """
+    cols = (0, 1) if projection == 'xy' else (0, 2)
+    # Bump the raw-data chunk cache well past the 1 MB default so the
+    # column hyperslab reads above never fetch the same chunk twice;
+    # rdcc_w0=1.0 evicts fully-read chunks first. For contiguous
+    # (unchunked) datasets the settings are a no-op.
+    with h5py.File(filename, 'r', rdcc_nbytes=128 * 1024 * 1024,
+                   rdcc_nslots=1_000_003, rdcc_w0=1.0) as f:
+        # Get header info
+        time = f['Header'].attrs['Time']
+
+        data = {}
+
+        # Load newly formed stars (PartType4); few enough to keep all 3 axes
+        if 'PartType4' in f:
+            data['newstars_pos'] = read_dataset(f, 'PartType4/Coordinates')
+        else:
+            data['newstars_pos'] = np.array([]).reshape(0, 3)
+
+        # Load pre-existing stellar disk (PartType2), projected columns only
+        if 'PartType2' in f:
+            data['disk_pos'] = read_columns(f, 'PartType2/Coordinates', cols)
+        else:
+            data['disk_pos'] = np.array([]).reshape(0, 2)
+
+        # Load bulge stars (PartType3), projected columns only
+        if 'PartType3' in f:
+            data['bulge_pos'] = read_columns(f, 'PartType3/Coordinates', cols)
+        else:
+            data['bulge_pos'] = np.array([]).reshape(0, 2)
+
+        data['time'] = time
+
+    return data
+
+def convert_to_npy(hdf5_file, out_prefix, projection='xy'):
+    """Convert one HDF5 snapshot to flat .npy mirrors and return the data.
+
+    Flat binaries memory-map straight out of the page cache on later
+    runs, with no HDF5 metadata walk or chunk handling; float32 is
+    plenty for plotting and halves the bytes on disk.
+    """
+    data = load_snapshot_hdf5(hdf5_file, projection)
+    np.save(out_prefix + '_disk.npy', data['disk_pos'].astype(np.float32, copy=False))
+    np.save(out_prefix + '_bulge.npy', data['bulge_pos'].astype(np.float32, copy=False))
+    np.save(out_prefix + '_newstars.npy', data['newstars_pos'].astype(np.float32, copy=False))
+    # written last: its presence marks the cache as complete
+    np.save(out_prefix + '_time.npy', np.float64(data['time']))
+    return data
+
+def load_snapshot(filename, projection='xy'):
+    """Load particle data, preferring the flat .npy cache.
+
+    The first run converts each HDF5 snapshot to .npy mirrors next to
+    it; later runs memory-map those and skip HDF5 entirely. A snapshot
+    rewritten by a newer simulation run is detected by its mtime and
+    reconverted, so the cache never serves stale frames.
+    """
+    prefix = os.path.splitext(filename)[0] + '_' + projection
+    marker = prefix + '_time.npy'
+    if os.path.exists(marker) and os.path.getmtime(marker) >= os.path.getmtime(filename):
+        return {
+            'disk_pos': np.load(prefix + '_disk.npy', mmap_mode='r'),
+            'bulge_pos': np.load(prefix + '_bulge.npy', mmap_mode='r'),
+            'newstars_pos': np.load(prefix + '_newstars.npy', mmap_mode='r'),
+            'time': float(np.load(prefix + '_time.npy')),
+        }
+    return convert_to_npy(filename, prefix, projection)
+
+def load_snapshots(snapshot_files, projection='xy'):
+    """Load all snapshots in parallel.
+
+    Under mpiexec with more than one rank, rank r reads snapshots
+    r, r+size, 2*size, ... and the results are gathered on rank 0,
+    which does the rendering; all other ranks get None back.  In a
+    plain serial run a local process pool is used instead.
+    """
+    if MPI is not None and MPI.COMM_WORLD.Get_size() > 1:
+        comm = MPI.COMM_WORLD
+        rank, size = comm.Get_rank(), comm.Get_size()
+        local = [(i, load_snapshot(snapshot_files[i], projection))
+                 for i in range(rank, len(snapshot_files), size)]
+        gathered = comm.gather(local, root=0)
+        if rank != 0:
+            return None
+        snapshots = [None] * len(snapshot_files)
+        for part in gathered:
+            for i, snap in part:
+                snapshots[i] = snap
+        return snapshots
+
+    with Pool(processes=min(8, len(snapshot_files))) as pool:
+        return pool.map(partial(load_snapshot, projection=projection),
+                        snapshot_files)
+
+def compute_density_vmax(snapshots, xlim, ylim, hist_bins):
+    """Global color scale for the log-density images.
+
+    One histogram pass over every snapshot finds the densest bin of
+    the whole run, so the same surface density maps to the same gray
+    level in every frame; rescaling to each frame's own maximum would
+    make the movie's brightness pump as the merger peak grows.
+    """
+    max_count = 0.0
+    for snap in snapshots:
+        xy = np.concatenate([snap['disk_pos'], snap['bulge_pos']])
+        H, _, _ = np.histogram2d(xy[:, 0], xy[:, 1], bins=hist_bins,
+                                 range=[xlim, ylim])
+        max_count = max(max_count, H.max())
+    return max(float(np.log1p(max_count)), 1.0)
+
+def save_limits_cache(frames_dir, xlim, ylim, vmax):
+    """Cache the computed axis limits and color scale next to the frames."""
+    np.savez(os.path.join(frames_dir, '_limits.npz'),
+             xlim=xlim, ylim=ylim, vmax=vmax)
+
+def load_limits_cache(frames_dir):
+    """Return cached (xlim, ylim, vmax), or None if no usable cache exists.
+
+    The second pair is whatever the view uses for its vertical axis
+    (Y face-on, Z edge-on). Caches from before the color scale was
+    stored are treated as missing.
+    """
+    path = os.path.join(frames_dir, '_limits.npz')
+    if not os.path.exists(path):
+        return None
+    cached = np.load(path)
+    if 'vmax' not in cached:
+        return None
+    return list(cached['xlim']), list(cached['ylim']), float(cached['vmax'])
+
+def save_animation(fig, animate, n_frames, save_file, fps, init_func=None):
+    """Write an animation by calling animate(frame) for each frame.
+
+    With ffmpeg on the PATH the raw RGBA canvas is piped straight into
+    its stdin: anim.save would round-trip every frame through a PNG
+    encode before ffmpeg decodes it again, and the FuncAnimation blit
+    machinery buys nothing during a save anyway. Without ffmpeg the
+    pillow writer produces an animated GIF instead.
+    """
+    if which('ffmpeg') is not None:
+        print(f"Saving animation to {save_file}...")
+        fig.canvas.draw()
+        w, h = fig.canvas.get_width_height()
+        proc = subprocess.Popen(
+            ['ffmpeg', '-y', '-loglevel', 'error',
+             '-f', 'rawvideo', '-vcodec', 'rawvideo',
+             '-s', f'{w}x{h}', '-pix_fmt', 'rgba', '-r', str(fps), '-i', '-',
+             '-vf', 'crop=trunc(iw/2)*2:trunc(ih/2)*2',  # libx264 needs even dims
+             '-c:v', 'libx264', '-pix_fmt', 'yuv420p', save_file],
+            stdin=subprocess.PIPE)
+        for frame in range(n_frames):
+            animate(frame)
+            fig.canvas.draw()
+            proc.stdin.write(fig.canvas.buffer_rgba())
+        proc.stdin.close()
+        if proc.wait() == 0:
+            print(f"Animation saved successfully to {save_file}")
+        else:
+            print("ffmpeg exited with an error")
+    else:
+        # No ffmpeg on the PATH: fall back to an animated GIF
+        print("ffmpeg not found, writing GIF instead...")
+        anim = animation.FuncAnimation(fig, animate, init_func=init_func,
+                                       frames=n_frames, interval=1000/fps,
+                                       blit=True, repeat=True)
+        gif_file = save_file.replace('.mp4', '.gif')
+        anim.save(gif_file, writer='pillow', fps=fps)
+        print(f"Animation saved as GIF: {gif_file}")